@@ -1,5 +1,6 @@
 from argparse import ArgumentParser
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 
 from loguru import logger
@@ -11,17 +12,40 @@ from .handlers import (
     DiscrepancyFinderHandler,
 )
 from .models.repositories import RepositoryFactory
+from .pipeline import PipelineRunner
 from .settings import Settings
 from .validator import (
     DateIsTooFarInTheFutureOrMissing,
     DiscrepancyFinder,
     FirstRowSumIsGreaterThanPermitted,
+    ServerSideDiscrepancyFinder,
     TitleIsShorterThanPermittedOrMissing,
 )
 
 logger = logger.patch(lambda record: record.update(name='discrepancy_finder'))
-settings = Settings()
-repository_factory = RepositoryFactory(MongoClient(settings.mongo_url), settings.database.name)
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    return Settings()
+
+
+def create_repository_factory(settings: Settings) -> RepositoryFactory:
+    client = MongoClient(
+        settings.mongo_url,
+        compressors=settings.database.compressors,
+        zlibCompressionLevel=settings.database.zlib_compression_level,
+        maxPoolSize=settings.database.max_pool_size,
+        retryWrites=True,
+    )
+    return RepositoryFactory(
+        client,
+        settings.database.name,
+        insert_batch_size=settings.database.insert_batch_size,
+        insert_parallelism=settings.database.insert_parallelism,
+        write_concern=settings.database.write_concern,
+        journal=settings.database.journal,
+    )
 
 
 def main():
@@ -29,28 +53,51 @@ def main():
     parser.add_argument("directory", type=Path)
     args = parser.parse_args()
 
+    settings = get_settings()
+
     logger.info(f"connecting to the database at {settings.database.url}")
+    repository_factory = create_repository_factory(settings)
     document_repository, discrepancy_repository = (
         repository_factory.create_document_repository(), repository_factory.create_discrepancy_repository()
     )
 
-    discrepancy_finder = DiscrepancyFinder(
+    repository_factory.audit_indexes(drop_unused=settings.drop_unused_indexes)
+
+    validators = (
         TitleIsShorterThanPermittedOrMissing(min_length=2),
         DateIsTooFarInTheFutureOrMissing(max_date=datetime(2023, 1, 1)),
         FirstRowSumIsGreaterThanPermitted(max_sum=5220),
     )
 
+    if settings.server_side_validation:
+        # the ingest pipeline stops after the insert stage;
+        # validation runs inside MongoDB once the documents are in place
+        pipeline = PipelineRunner(
+            DirectoryParsingHandler(
+                batch_size=settings.database.insert_batch_size,
+                cache_directory=settings.parser_cache_directory,
+            ),
+            DatabaseInsertHandler(repository=document_repository),
+        )
+    else:
+        pipeline = PipelineRunner(
+            DirectoryParsingHandler(
+                batch_size=settings.database.insert_batch_size,
+                cache_directory=settings.parser_cache_directory,
+            ),
+            DatabaseInsertHandler(repository=document_repository),
+            DiscrepancyFinderHandler(
+                repository=document_repository,
+                discrepancy_finder=DiscrepancyFinder(*validators)
+            ),
+            DatabaseInsertHandler(repository=discrepancy_repository),
+        )
+
     try:
-        DirectoryParsingHandler().chain(
-            DatabaseInsertHandler(repository=document_repository).chain(
-                DiscrepancyFinderHandler(
-                    repository=document_repository,
-                    discrepancy_finder=discrepancy_finder
-                ).chain(
-                    DatabaseInsertHandler(repository=discrepancy_repository)
-                )
-            )
-        ).handle(args.directory)
+        pipeline.run(args.directory)
+
+        if settings.server_side_validation:
+            ServerSideDiscrepancyFinder(*validators).find_discrepancies(document_repository.get_collection())
     except Exception as e:
         logger.exception(f"an error occurred: {e}")
 
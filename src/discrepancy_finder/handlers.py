@@ -1,73 +1,90 @@
 from abc import ABCMeta, abstractmethod
 from pathlib import Path
-from typing import Any, Iterable
+from typing import Any, Iterable, Optional
 
 from loguru import logger
 from pymongo.errors import BulkWriteError
 
 from .models.base import BaseModelWithObjectId
-from .models.document import DocumentId
+from .models.document import Document
 from .models.repositories import AbstractRepositoryWithInsertMany, DocumentRepository
 from .parser import Parser
 from .validator import DiscrepancyFinder
 
 
 class AbstractHandler(metaclass=ABCMeta):
-    # https://refactoring.guru/design-patterns/chain-of-responsibility
-    def __init__(self):
-        self._next_handler = None
-
-    def chain(self, handler):
-        self._next_handler = handler
-        return self
-
+    # a stage of pipeline.PipelineRunner: consumes the previous stage's output
+    # and returns an iterable that is streamed to the next stage
     @abstractmethod
-    def handle(self, request: Any):
-        if self._next_handler is not None:
-            return self._next_handler.handle(request)
-        return None
+    def handle(self, request: Any) -> Iterable:
+        ...
+
+    def __call__(self, request: Any) -> Iterable:
+        return self.handle(request)
 
 
 class DirectoryParsingHandler(AbstractHandler):
-    def handle(self, directory: Path):
+    def __init__(self, batch_size: int = 1000, cache_directory: Optional[Path] = None):
+        self.batch_size = batch_size
+        self.cache_directory = cache_directory
+
+    def handle(self, directory: Path) -> Iterable[list[Document]]:
         logger.info(f"processing documents from {directory}")
-        return super().handle(Parser.parse(directory))
+        return Parser.parse_batched(directory, self.batch_size, cache_directory=self.cache_directory)
 
 
 class DatabaseHandler(AbstractHandler, metaclass=ABCMeta):
     def __init__(self, repository: AbstractRepositoryWithInsertMany):
-        super().__init__()
         self.repository = repository
 
 
 class DatabaseInsertHandler(DatabaseHandler):
-    def handle(self, data: Iterable[BaseModelWithObjectId]):
-        try:
-            data = list(data)
-            logger.debug(f"saving {len(data)} items to the database")
-            result = self.repository.insert_many(data)
-        except BulkWriteError as bwe:
-            logger.error(f"an error occurred while saving data: {bwe.details}")
-            result = None
-            data = []
-
-        if result is None or not result.inserted_ids:
+    def handle(self, batches: Iterable[list[BaseModelWithObjectId]]) -> Iterable[list[BaseModelWithObjectId]]:
+        # the pipeline carries ready-made batches, so each one maps straight
+        # onto an insert_many call and is forwarded whole
+        saved = 0
+
+        for batch in batches:
+            logger.debug(f"saving {len(batch)} items to the database")
+
+            try:
+                result = self.repository.insert_many(batch)
+            except BulkWriteError as bwe:
+                logger.error(f"an error occurred while saving data: {bwe.details}")
+                continue
+
+            saved += len(result.inserted_ids)
+            # the models now carry their freshly assigned ids,
+            # so downstream stages can use them without re-fetching
+            yield batch
+
+        if saved == 0:
             logger.warning("no data was inserted")
         else:
-            logger.info(f"saved {len(result.inserted_ids)} items")
-
-        return super().handle((data_item.id for data_item in data))
+            logger.info(f"saved {saved} items")
 
 
 class DiscrepancyFinderHandler(DatabaseHandler):
-    def __init__(self, repository: DocumentRepository, discrepancy_finder: DiscrepancyFinder):
+    def __init__(
+            self,
+            repository: DocumentRepository,
+            discrepancy_finder: DiscrepancyFinder,
+            fetch_from_repository: bool = False
+    ):
         super().__init__(repository)
         self.discrepancy_finder = discrepancy_finder
+        self.fetch_from_repository = fetch_from_repository
+
+    def handle(self, batches: Iterable[list[Document]]):
+        logger.info("validating documents")
+
+        for batch in batches:
+            if self.fetch_from_repository:
+                # round-trip through the database instead of trusting the in-memory copies
+                batch = self.repository.find_by(
+                    {"id": {"$in": [document.id for document in batch]}}
+                )
 
-    def handle(self, document_ids: Iterable[DocumentId]):
-        logger.info("validating documents in the database")
-        return super().handle(
-            self.discrepancy_finder.find_discrepancies(
-                self.repository.find_by({"id": {"$in": list(document_ids)}})
-            )
-        )
+            discrepancies = list(self.discrepancy_finder.find_discrepancies(batch))
+            if discrepancies:
+                yield discrepancies
@@ -1,33 +1,74 @@
-from typing import Generic, Iterable
+import itertools
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Generic, Iterable, Optional, Union
 
+from loguru import logger
 from pydantic_mongo import AbstractRepository
 from pydantic_mongo.abstract_repository import T
+from pymongo import ASCENDING
+from pymongo.database import Database
+from pymongo.errors import OperationFailure
 from pymongo.results import InsertManyResult
+from pymongo.write_concern import WriteConcern
 
 from .discrepancy import Discrepancy
 from .document import Document
 
 
 class AbstractRepositoryWithInsertMany(AbstractRepository, Generic[T]):
+    def __init__(self, database: Database, insert_batch_size: int = 1000, insert_parallelism: int = 1):
+        super().__init__(database)
+        self.insert_batch_size = insert_batch_size
+        self.insert_parallelism = insert_parallelism
+
+    def _insert_batch(self, batch: list) -> list:
+        result = self.get_collection().insert_many(
+            (self.to_document(model) for model in batch),
+            ordered=False
+        )
+
+        for model, inserted_id in zip(batch, result.inserted_ids):
+            # writing to __dict__ skips pydantic's __setattr__ machinery;
+            # the ObjectId comes straight from the driver, so it needs no validation
+            model.__dict__['id'] = inserted_id
+
+        return result.inserted_ids
+
     def insert_many(self, models: Iterable[T]) -> InsertManyResult:
         """
         This method, unlike the original save_many, returns the result of the insert_many operation.
+
+        Models are inserted in unordered batches of `insert_batch_size` instead of a single
+        call, so the iterable is never fully materialized and one bad document does not
+        abort the rest. With `insert_parallelism` > 1 batches are submitted concurrently.
         :param models:
         :return:
         """
-        models_to_insert = [
-            model for model in models if model.id is None
-        ]
-
-        if not models_to_insert:
-            return InsertManyResult([], False)
-
-        result = self.get_collection().insert_many((self.to_document(model) for model in models_to_insert))
-
-        for idx, inserted_id in enumerate(result.inserted_ids):
-            models_to_insert[idx].id = inserted_id
-
-        return result
+        models_to_insert = (model for model in models if model.id is None)
+        batches = iter(lambda: list(itertools.islice(models_to_insert, self.insert_batch_size)), [])
+
+        inserted_ids = []
+        if self.insert_parallelism > 1:
+            with ThreadPoolExecutor(max_workers=self.insert_parallelism) as executor:
+                # executor.map would eagerly drain the whole iterator into the
+                # work queue; submitting one batch per worker and topping up as
+                # inserts finish keeps at most insert_parallelism batches
+                # materialized at a time
+                in_flight = {
+                    executor.submit(self._insert_batch, batch)
+                    for batch in itertools.islice(batches, self.insert_parallelism)
+                }
+                while in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        inserted_ids.extend(future.result())
+                        if (batch := next(batches, None)) is not None:
+                            in_flight.add(executor.submit(self._insert_batch, batch))
+        else:
+            for batch in batches:
+                inserted_ids.extend(self._insert_batch(batch))
+
+        return InsertManyResult(inserted_ids, acknowledged=bool(inserted_ids))
 
 
 class DocumentRepository(AbstractRepositoryWithInsertMany[Document]):
@@ -42,11 +83,69 @@ class DiscrepancyRepository(AbstractRepositoryWithInsertMany[Discrepancy]):
 
 class RepositoryFactory:
     # https://refactoring.guru/design-patterns/factory-method
-    def __init__(self, client, database):
-        self.database = client[database]
+    def __init__(
+            self,
+            client,
+            database,
+            insert_batch_size: int = 1000,
+            insert_parallelism: int = 1,
+            write_concern: Optional[Union[int, str]] = None,
+            journal: bool = False,
+            ensure_indexes: bool = True
+    ):
+        if write_concern is not None:
+            # a relaxed write concern (w=1, no journal ack) noticeably speeds up
+            # the bulk ingest; durability is the caller's trade-off to make
+            self.database = client.get_database(database, write_concern=WriteConcern(w=write_concern, j=journal))
+        else:
+            self.database = client[database]
+        self.insert_batch_size = insert_batch_size
+        self.insert_parallelism = insert_parallelism
+        self.ensure_indexes = ensure_indexes
+        self._ensured_indexes = set()
+
+    def _ensure_index(self, collection_name, unique=False):
+        # lookups by document_id would otherwise be collection scans;
+        # guarded so the round trip happens once per factory, not per repository
+        if not self.ensure_indexes or collection_name in self._ensured_indexes:
+            return
+
+        self.database[collection_name].create_index([('document_id', ASCENDING)], unique=unique)
+        self._ensured_indexes.add(collection_name)
+
+    # indexes maintained by the application (the factory's document_id indexes
+    # and ServerSideDiscrepancyFinder's discrepancy_id merge target);
+    # never reported or dropped by the audit
+    _own_indexes = frozenset({'_id_', 'document_id_1', 'discrepancy_id_1'})
+
+    def audit_indexes(self, drop_unused: bool = False):
+        """
+        Logs indexes that have served no operations since server start, based on
+        `$indexStats`. Every extra index taxes each insert, so unused ones are
+        worth knowing about; with `drop_unused` they are actively removed.
+        """
+        for collection_name in (DocumentRepository.Meta.collection_name, DiscrepancyRepository.Meta.collection_name):
+            collection = self.database[collection_name]
+
+            try:
+                index_stats = list(collection.aggregate([{'$indexStats': {}}]))
+            except OperationFailure as e:
+                logger.warning(f"could not collect index statistics for {collection_name}: {e}")
+                continue
+
+            for stats in index_stats:
+                if stats['name'] in self._own_indexes or stats['accesses']['ops'] > 0:
+                    continue
+
+                logger.warning(f"index {stats['name']} on {collection_name} has not been used since server start")
+                if drop_unused:
+                    logger.warning(f"dropping unused index {stats['name']} on {collection_name}")
+                    collection.drop_index(stats['name'])
 
     def create_document_repository(self):
-        return DocumentRepository(self.database)
+        self._ensure_index(DocumentRepository.Meta.collection_name, unique=True)
+        return DocumentRepository(self.database, self.insert_batch_size, self.insert_parallelism)
 
     def create_discrepancy_repository(self):
-        return DiscrepancyRepository(self.database)
+        self._ensure_index(DiscrepancyRepository.Meta.collection_name)
+        return DiscrepancyRepository(self.database, self.insert_batch_size, self.insert_parallelism)
@@ -1,10 +1,17 @@
+import contextlib
+import functools
+import itertools
+import os
 import re
+import shelve
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from datetime import datetime
 from pathlib import Path
-from typing import Iterable
+from typing import Iterable, Optional
 
-from bs4 import BeautifulSoup, Tag
+import numpy
 from loguru import logger
+from lxml import etree
 
 from .models.document import Document, DocumentId, DocumentRow
 
@@ -12,102 +19,301 @@ from .models.document import Document, DocumentId, DocumentRow
 class DateParser:
     def __init__(self, *formats):
         self.formats = formats
+        self._last_good_format = None
 
-    def parse_date(self, raw_date: str | None) -> datetime | None:
+    @functools.lru_cache(maxsize=4096)
+    def parse_date(self, raw_date: str | None, date_format: str | None = None) -> datetime | None:
         if raw_date is None:
             return None
 
-        for date_format in self.formats:
+        if date_format is not None:
+            # the caller already knows the format (e.g. from the regex
+            # alternation that matched), so no trial parsing is needed
             try:
                 return datetime.strptime(raw_date, date_format)
             except ValueError:
-                pass
+                pass  # a wrong hint falls back to trying every format
+
+        formats = self.formats
+        if self._last_good_format is not None:
+            # files of one batch tend to share a date format, so a failed strptime
+            # (and its exception overhead) is mostly avoided by trying the format
+            # that matched last time first
+            formats = (
+                self._last_good_format,
+                *(date_format for date_format in self.formats if date_format != self._last_good_format)
+            )
+
+        for date_format in formats:
+            try:
+                parsed_date = datetime.strptime(raw_date, date_format)
+            except ValueError:
+                continue
+
+            self._last_good_format = date_format
+            return parsed_date
+
         return None
 
+    def prime(self):
+        """
+        Compiles every format into CPython's internal strptime regex cache upfront,
+        so the first real parse of each format does not pay the compilation cost.
+        """
+        reference_date = datetime(2000, 1, 1)
+        for date_format in self.formats:
+            datetime.strptime(reference_date.strftime(date_format), date_format)
+        return self
+
 
 class DiscrepancyParserWarning(UserWarning):
     pass
 
 
 _raw_date_and_country_regex = re.compile(
-    r'Creation:\s?(?P<date>\d{1,2}[A-Z][a-z]{2}\d{2,4})\s?(?P<country>.*)'
+    r'Creation:\s?'
+    r'(?P<date>'
+    r'(?P<date_full_year>\d{1,2}[A-Z][a-z]{2}\d{4})'
+    r'|(?P<date_short_year>\d{1,2}[A-Z][a-z]{2}\d{2,3})'
+    r')'
+    r'\s?(?P<country>.*)'
 )
 
+# the alternation branch that matched already identifies the date format,
+# so parse_date can be handed it instead of discovering it by trial
+_date_format_by_group = {
+    'date_full_year': '%d%b%Y',
+    'date_short_year': '%d%b%y',
+}
+
+_date_parser = DateParser(
+    '%d%b%Y',
+    '%d%b%y',
+    '%d%b'
+).prime()
+
+
+@functools.lru_cache(maxsize=2048)
+def _extract_creation(footer: str | None) -> tuple[datetime | None, str | None]:
+    # footers repeat across documents of a batch, so the regex and the date
+    # parse run once per distinct footer string instead of once per file
+    match = _raw_date_and_country_regex.match(footer if footer else '')
+    if match is None:
+        return None, None
+
+    date_format = None
+    for group, candidate_format in _date_format_by_group.items():
+        if match[group] is not None:
+            date_format = candidate_format
+            break
+
+    return _date_parser.parse_date(match['date'], date_format), match['country']
+
+_html_parser = etree.HTMLParser()
+
+# strips whitespace and the percent sign in one C-level pass
+_row_data_translation = str.maketrans('', '', ' \t\n\r%')
+
+# compiled once, these run the tree traversal entirely inside libxml2;
+# the equivalent BS4 accessors walk the tree at Python speed
+_table_xpath = etree.XPath('(//table)[1]')
+_caption_xpath = etree.XPath('./caption')
+_footer_cell_xpath = etree.XPath('./tfoot/tr/td')
+_header_cells_xpath = etree.XPath('./thead/tr/th[position()>1]')
+_rows_xpath = etree.XPath('./tbody/tr')
+_cells_xpath = etree.XPath('./td')
+
 
 class Parser:
     def __init__(self):
         pass
 
+    # rows shorter than this are parsed cell by cell; NumPy's conversion
+    # overhead only pays off on longer rows (same threshold as the validator)
+    _vectorization_threshold = 32
+
     @staticmethod
     def _parse_row_data(data: str):
-        data = data.strip()
-        if data.endswith('%'):
-            return float(data[:-1]) / 100
-        return float(data)
+        # one C-level translate drops whitespace and the percent sign together,
+        # replacing the strip/endswith/slice sequence with a single float() path
+        value = float(data.translate(_row_data_translation))
+        return value / 100 if '%' in data else value
 
-    @staticmethod
-    def _parse_title(table: Tag) -> str | None:
-        caption = table.caption
-        if caption is not None:
-            return caption.text
-        return None
+    @classmethod
+    def _parse_row_values(cls, cells: list[str]) -> list[float]:
+        count = len(cells)
+        if count < cls._vectorization_threshold:
+            return [cls._parse_row_data(cell) for cell in cells]
+
+        # NumPy converts the whole row to float64 in one C call
+        values = numpy.fromiter(
+            (cell.translate(_row_data_translation) for cell in cells),
+            dtype=numpy.float64,
+            count=count
+        )
+        percent_mask = numpy.fromiter(('%' in cell for cell in cells), dtype=bool, count=count)
+        values[percent_mask] /= 100
+        return values.tolist()
 
     @staticmethod
-    def _parse_footer(table: Tag) -> str | None:
-        tfoot = table.tfoot
-        if tfoot is not None:
-            return tfoot.tr.td.text
+    def _parse_title(table: etree._Element) -> str | None:
+        caption = _caption_xpath(table)
+        if caption:
+            return ''.join(caption[0].itertext())
         return None
 
     @staticmethod
-    def _parse_date(raw_date: str) -> datetime | None:
-        date_parser = DateParser(
-            '%d%b%Y',
-            '%d%b%y',
-            '%d%b'
-        )
-        return date_parser.parse_date(raw_date)
+    def _parse_footer(table: etree._Element) -> str | None:
+        footer_cell = _footer_cell_xpath(table)
+        if footer_cell:
+            return ''.join(footer_cell[0].itertext())
+        return None
 
     @classmethod
     def parse_file(cls, file: Path) -> Document:
-        with open(file, 'r') as f:
-            soup = BeautifulSoup(f, 'html.parser')
+        # raw bytes go straight to libxml2, which detects the encoding in C;
+        # decoding to str first would add a full-buffer pass per file
+        return cls.parse_content(file.read_bytes())
 
-        table = soup.table
+    @classmethod
+    def parse_content(cls, content: bytes | str) -> Document:
+        # libxml2 parses the HTML several times faster than the pure-Python html.parser
+        table = _table_xpath(etree.fromstring(content, _html_parser))[0]
 
         footer = cls._parse_footer(table)
-        date_and_country_regex_match = _raw_date_and_country_regex.match(footer if footer else '')
-        raw_date_of_creation, country_of_creation = (
-            date_and_country_regex_match.groups() if date_and_country_regex_match else (
-                None, None
-            )
-        )
-        date_of_creation = cls._parse_date(raw_date_of_creation)
+        date_of_creation, country_of_creation = _extract_creation(footer)
+
+        body = []
+        for row in _rows_xpath(table):
+            cells = _cells_xpath(row)
+            # itertext() concatenates all descendant text like BS4's .text did;
+            # lxml's .text alone stops at the first child element
+            body.append(DocumentRow(
+                header=''.join(cells[0].itertext()).strip(),
+                body=cls._parse_row_values([''.join(cell.itertext()) for cell in cells[1:]])
+            ))
 
         return Document(
-            document_id=DocumentId(table.attrs.get('id')),
+            document_id=DocumentId(table.get('id')),
             title=cls._parse_title(table),
-            header=[th.text.strip() for th in table.thead.tr.find_all('th')[1:]],
-            body=[
-                DocumentRow(
-                    header=row.td.text.strip(),
-                    body=[cls._parse_row_data(td.text) for td in row.find_all('td')[1:]]
-                )
-                for row in table.tbody.find_all('tr')
-            ],
+            header=[''.join(th.itertext()).strip() for th in _header_cells_xpath(table)],
+            body=body,
             footer=footer,
             country_of_creation=country_of_creation,
             date_of_creation=date_of_creation
         )
 
+    # on a cold cache traversal is dominated by per-file open/read/close latency,
+    # so this many reads are kept in flight at once
+    _read_queue_depth = 64
+
+    @staticmethod
+    def _cache_key(file: Path) -> str:
+        # mtime and size change whenever the file does, so a stale cache
+        # entry can never be served for an edited file
+        stat = file.stat()
+        return f'{file}:{stat.st_mtime_ns}:{stat.st_size}'
+
     @classmethod
-    def parse(cls, directory: Path) -> Iterable[Document]:
-        # assuming that the directory does not contain any subdirectories
-        for file in directory.glob('*.html'):
-            if not file.is_file():
-                continue
+    def parse(
+            cls,
+            directory: Path,
+            workers: Optional[int] = None,
+            cache_directory: Optional[Path] = None
+    ) -> Iterable[Document]:
+        # assuming that the directory does not contain any subdirectories;
+        # scandir answers is_file() from the directory entry itself,
+        # avoiding the extra stat and Path construction glob() pays per file
+        with os.scandir(directory) as entries:
+            files = [
+                Path(entry.path)
+                for entry in entries
+                if entry.name.endswith('.html') and entry.is_file()
+            ]
 
-            try:
-                yield cls.parse_file(file)
-            except Exception as e:
-                logger.warning(f'Failed to parse {file}: {e}', DiscrepancyParserWarning)
+        cache_keys: dict[Path, str] = {}
+        with contextlib.ExitStack() as stack:
+            cache = None
+            if cache_directory is not None:
+                cache_directory.mkdir(parents=True, exist_ok=True)
+                cache = stack.enter_context(shelve.open(str(cache_directory / 'parsed-documents')))
+
+                pending = []
+                for file in files:
+                    try:
+                        key = cls._cache_key(file)
+                    except OSError:
+                        # the file vanished between scandir and stat; let the
+                        # read stage report it the usual way
+                        pending.append(file)
+                        continue
+
+                    if key in cache:
+                        yield cache[key]
+                    else:
+                        cache_keys[file] = key
+                        pending.append(file)
+                files = pending
+
+            # reads are I/O-bound and release the GIL, so they are overlapped in a thread
+            # pool, while parsing a file is pure CPU work with no shared state and is
+            # spread over a process pool; documents are yielded as they complete
+            reader = stack.enter_context(ThreadPoolExecutor(max_workers=cls._read_queue_depth))
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+
+            # reads and parses run as one sliding window of at most
+            # _read_queue_depth futures: new reads are only submitted as
+            # earlier files finish parsing, completed futures are dropped
+            # immediately, and each yield pauses the window until the
+            # consumer takes the document, so at no point are more than
+            # _read_queue_depth file contents or documents held in memory
+            pending_files = iter(files)
+            reads: dict = {}
+            parses: dict = {}
+
+            while True:
+                while len(reads) + len(parses) < cls._read_queue_depth:
+                    file = next(pending_files, None)
+                    if file is None:
+                        break
+                    reads[reader.submit(file.read_bytes)] = file
+
+                if not reads and not parses:
+                    break
+
+                done, _ = wait(reads.keys() | parses.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in reads:
+                        file = reads.pop(future)
+                        try:
+                            content = future.result()
+                        except OSError as e:
+                            logger.warning(f'Failed to read {file}: {e}', DiscrepancyParserWarning)
+                            continue
+                        parses[executor.submit(cls.parse_content, content)] = file
+                        continue
+
+                    file = parses.pop(future)
+                    try:
+                        document = future.result()
+                    except Exception as e:
+                        logger.warning(f'Failed to parse {file}: {e}', DiscrepancyParserWarning)
+                        continue
+
+                    if cache is not None and file in cache_keys:
+                        cache[cache_keys[file]] = document
+                    yield document
+
+    @classmethod
+    def parse_batched(
+            cls,
+            directory: Path,
+            batch_size: int = 1000,
+            workers: Optional[int] = None,
+            cache_directory: Optional[Path] = None
+    ) -> Iterable[list[Document]]:
+        # emitting lists instead of single documents lets downstream stages
+        # pass whole batches to insert_many without re-collecting them
+        documents = iter(cls.parse(directory, workers, cache_directory))
+        while batch := list(itertools.islice(documents, batch_size)):
+            yield batch
@@ -0,0 +1,69 @@
+import queue
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable
+
+from loguru import logger
+
+_SENTINEL = object()
+
+# a pipeline stage is any callable taking the previous stage's output
+# and returning an iterable for the next one; AbstractHandler instances
+# qualify through their __call__
+Stage = Callable[[Any], Iterable]
+
+
+class PipelineRunner:
+    # https://refactoring.guru/design-patterns/chain-of-responsibility, reworked as a producer-consumer pipeline
+    """
+    Runs stages as concurrent pipeline steps connected by bounded queues.
+
+    Each stage consumes the output of the previous one and its results are
+    streamed to the next, so parsing, insertion and validation overlap
+    instead of running strictly one after another. Bounded queues apply
+    back-pressure: a fast producer blocks until the consumer catches up,
+    keeping memory usage flat regardless of input size.
+    """
+
+    # queue items are insert_batch_size-sized lists of documents, not single
+    # documents, so a handful of slots already buffers thousands of them;
+    # anything larger would postpone back-pressure past any reasonable footprint
+    def __init__(self, *stages: Stage, queue_size: int = 4):
+        self.stages = stages
+        self.queue_size = queue_size
+
+    @staticmethod
+    def _drain(input_queue: queue.Queue) -> Iterator:
+        while (item := input_queue.get()) is not _SENTINEL:
+            yield item
+
+    @staticmethod
+    def _run_stage(stage: Stage, request: Any, output_queue: queue.Queue | None):
+        try:
+            results = stage(request)
+            if results is not None:
+                for item in results:
+                    if output_queue is not None:
+                        output_queue.put(item)
+        except Exception as e:
+            logger.exception(f"pipeline stage {getattr(stage, '__name__', stage.__class__.__name__)} failed: {e}")
+            # exhaust the upstream stage so its bounded queue never blocks on a dead consumer
+            if isinstance(request, Iterator):
+                for _ in request:
+                    pass
+        finally:
+            if output_queue is not None:
+                output_queue.put(_SENTINEL)
+
+    def run(self, request: Any):
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages[:-1]]
+
+        with ThreadPoolExecutor(max_workers=len(self.stages)) as executor:
+            futures = []
+            for index, stage in enumerate(self.stages):
+                stage_input = request if index == 0 else self._drain(queues[index - 1])
+                stage_output = queues[index] if index < len(queues) else None
+                futures.append(executor.submit(self._run_stage, stage, stage_input, stage_output))
+
+            for future in futures:
+                future.result()
@@ -1,3 +1,6 @@
+from pathlib import Path
+from typing import Optional, Union
+
 from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -8,6 +11,18 @@ class DatabaseSettings(BaseModel):
     password: str
     name: str
     scheme: str = 'mongodb+srv'
+    insert_batch_size: int = 1000
+    insert_parallelism: int = 1
+    # w=1 without journal fsync trades durability for insert throughput,
+    # which is the right default for a re-runnable one-shot ingest;
+    # set to 'majority' for durable writes
+    write_concern: Union[int, str] = 1
+    journal: bool = False
+    # parsed documents are repetitive BSON and compress well,
+    # so wire compression is worth it on anything but loopback
+    compressors: str = 'zstd,zlib'
+    zlib_compression_level: int = 3
+    max_pool_size: int = 50
 
 
 class Settings(BaseSettings):
@@ -15,6 +30,16 @@ class Settings(BaseSettings):
                                       env_file='.env')
 
     database: DatabaseSettings
+    # when enabled, discrepancy rules run inside MongoDB as aggregation
+    # pipelines instead of fetching documents back to the client
+    server_side_validation: bool = False
+    # when enabled, the startup index audit actively drops indexes
+    # that have served no operations instead of only warning about them
+    drop_unused_indexes: bool = False
+    # when set, parsed documents are cached on disk keyed by the source
+    # file's path, mtime and size, so re-runs over an unchanged directory
+    # skip reading and parsing the files entirely
+    parser_cache_directory: Optional[Path] = None
 
     @property
     def mongo_url(self):
@@ -1,11 +1,12 @@
 import functools
 import inspect
-import itertools
 from abc import ABC, ABCMeta, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from enum import Enum
 from typing import Iterable, NamedTuple, Optional
 
+import numpy
 from loguru import logger
 from typing_extensions import NotRequired, TypedDict
 
@@ -17,31 +18,6 @@ from .models.discrepancy import (
 from .models.document import Document
 
 
-def on_exception(return_value, exception_types=(Exception,)):
-    # https://refactoring.guru/design-patterns/decorator
-    """
-    Decorator that catches exceptions and returns a default value or the result of a function.
-    :param return_value:
-        value to return if an exception is caught, can be callable,
-        if it is callable, it will be called with the exception as its first argument,
-        followed by *args and **kwargs of the decorated function
-    :param exception_types: types of exceptions to catch
-    :return: a wrapper function that catches exceptions in decorated function
-    """
-
-    def on_exception_decorator(func):
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            try:
-                return func(*args, **kwargs)
-            except exception_types as e:
-                return return_value if not callable(return_value) else return_value(e, *args, **kwargs)
-
-        return wrapper
-
-    return on_exception_decorator
-
-
 class ValidationStatus(Enum):
     VALID = 'valid'
     INVALID = 'invalid'
@@ -64,6 +40,25 @@ class ValidationResult(NamedTuple):
     info: ValidationResultInfo
 
 
+# callers only read the info of non-valid results, so every valid document
+# can share this one result instead of assembling an info dict it never uses
+_VALID_RESULT = ValidationResult(ValidationStatus.VALID, {})
+
+
+def _wrap_validate(validate):
+    # the generic on_exception decorator paid for *args/**kwargs packing and a
+    # callable() check on every call; validate's signature is fixed, so the
+    # wrapper spells it out and only does work on the exceptional path
+    @functools.wraps(validate)
+    def wrapper(self, document):
+        try:
+            return validate(self, document)
+        except Exception as exception:
+            return self.create_result(ValidationStatus.ERROR, document, error=exception)
+
+    return wrapper
+
+
 class DocumentValidatorMeta(ABCMeta):
     def __new__(mcs, name, bases, attrs):
         cls = super().__new__(mcs, name, bases, attrs)
@@ -74,11 +69,29 @@ class DocumentValidatorMeta(ABCMeta):
         if "location" not in attrs:
             raise AttributeError(f"{cls.__name__} should have `location` class-level attribute")
 
+        if not isinstance(attrs["location"], str):
+            # catches, among others, the easy-to-miss trailing comma that
+            # would silently turn the location into a 1-tuple
+            raise TypeError(
+                f"{cls.__name__}.location should be a DiscrepancyLocation, "
+                f"got {type(attrs['location']).__name__}"
+            )
+
+        if "validate" in attrs:
+            # applied here so subclasses get the error-to-result conversion
+            # without each of them repeating a decorator
+            cls.validate = _wrap_validate(attrs["validate"])
+
         return cls
 
 
 class DocumentValidator(ABC, metaclass=DocumentValidatorMeta):
     location: DiscrepancyLocation
+    # relative cost heuristic; DiscrepancyFinder orders validators by it so
+    # cheap rules report first. Every validator still runs on every document
+    # — a document can legitimately carry several discrepancies — so the
+    # order affects output ordering, not the amount of work done
+    cost: int = 0
     # also https://refactoring.guru/design-patterns/strategy, as a Strategy interface
     """
     This class implements __str__ so that it can be easily converted to a string to be stored in the database.
@@ -92,6 +105,20 @@ class DocumentValidator(ABC, metaclass=DocumentValidatorMeta):
     def name(self):
         return str(self)
 
+    @functools.cached_property
+    def _static_info(self) -> dict:
+        # the rule name, its parameters and the default location never change
+        # after construction, so they are computed once per validator instead
+        # of on every validation (underscore attributes, including this cache
+        # itself, are not parameters)
+        return {
+            'rule': str(self),
+            'rule_parameters': {
+                name: value for name, value in vars(self).items() if not name.startswith('_')
+            },
+            'location': self.location,
+        }
+
     def get_info(
             self,
             document: Document,
@@ -99,17 +126,15 @@ class DocumentValidator(ABC, metaclass=DocumentValidatorMeta):
             override_location: Optional[DiscrepancyLocation] = None,
             error: Optional[Exception] = None
     ) -> ValidationResultInfo:
-        parameters = vars(self)
-        location: DiscrepancyLocation = self.location if override_location is None else override_location
-
         result = {
+            **self._static_info,
             'document_id': document.document_id,
-            'rule': str(self),
-            'rule_parameters': parameters,
-            'location': location,
             'status': status.value
         }
 
+        if override_location is not None:
+            result['location'] = override_location
+
         if error is not None:
             result['error'] = str(error)
 
@@ -127,12 +152,19 @@ class DocumentValidator(ABC, metaclass=DocumentValidatorMeta):
             info=self.get_info(document, status, override_location, error)
         )
 
+    def to_match_stage(self) -> dict:
+        """
+        Returns a MongoDB `$match` filter selecting documents that violate this rule,
+        for validators that can be evaluated server-side by ServerSideDiscrepancyFinder.
+        """
+        raise NotImplementedError(f"{self.name} cannot be evaluated server-side")
+
     @abstractmethod
     def validate(self, document: Document) -> ValidationResult:
         """
         This method validates the document
 
-        It is an abstract method of DocumentValidator, it returns a result with VALID status.
+        It is an abstract method of DocumentValidator, it returns the shared VALID result.
 
         DocumentValidator subclasses are expected to call its parent `validate` method on success instead of providing
         a success result. It allows to re-use and generalize validator classes.
@@ -140,36 +172,32 @@ class DocumentValidator(ABC, metaclass=DocumentValidatorMeta):
         :param document:
         :return: an instance of ValidationResult
         """
-        return self.create_result(ValidationStatus.VALID, document=document)
-
-
-# this decorator is designed to be applied
-# to DocumentValidator subclasses instead of default exception handling in base class
-default_on_exception = on_exception(
-    lambda exception, obj, document: obj.create_result(
-        ValidationStatus.ERROR,
-        document,
-        error=exception
-    )
-)
+        return _VALID_RESULT
 
 
 class TitleIsShorterThanPermittedOrMissing(DocumentValidator):
     location = DiscrepancyLocation("$.title")
+    cost = 1
 
     def __init__(self, min_length: int):
         self.min_length = min_length
 
-    @default_on_exception
+    def to_match_stage(self) -> dict:
+        # unlike the client-side validate, which only reports missing titles,
+        # this also flags short-but-present ones, as the rule name promises
+        return {
+            '$or': [
+                {'title': None},
+                {'$expr': {'$lt': [{'$strLenCP': {'$ifNull': ['$title', '']}}, self.min_length]}}
+            ]
+        }
+
     def validate(self, document: Document) -> ValidationResult:
         has_title = document.title is not None
         title_has_permitted_length = has_title and len(document.title) >= self.min_length
 
         if has_title and title_has_permitted_length:
-            return self.create_result(
-                ValidationStatus.VALID,
-                document=document
-            )
+            return super().validate(document)
 
         if not has_title:
             return self.create_result(
@@ -182,20 +210,27 @@ class TitleIsShorterThanPermittedOrMissing(DocumentValidator):
 
 class DateIsTooFarInTheFutureOrMissing(DocumentValidator):
     location = DiscrepancyLocation("$.date_of_creation")
+    cost = 2
 
     def __init__(self, max_date: datetime):
         self.max_date = max_date
 
-    @default_on_exception
+    def to_match_stage(self) -> dict:
+        # unlike the client-side validate, which only reports missing dates,
+        # this also flags dates past max_date, as the rule name promises
+        return {
+            '$or': [
+                {'date_of_creation': None},
+                {'date_of_creation': {'$gt': self.max_date}}
+            ]
+        }
+
     def validate(self, document: Document) -> ValidationResult:
         has_date = document.date_of_creation is not None
         date_is_before_max = has_date and document.date_of_creation <= self.max_date
 
         if has_date and date_is_before_max:
-            return self.create_result(
-                ValidationStatus.VALID,
-                document=document
-            )
+            return super().validate(document)
 
         if not has_date:
             return self.create_result(
@@ -208,11 +243,38 @@ class DateIsTooFarInTheFutureOrMissing(DocumentValidator):
 
 class FirstRowSumIsGreaterThanPermitted(DocumentValidator):
     location = DiscrepancyLocation(f"$.body[0]")
+    # the running-sum scan over the first row makes this the most expensive rule
+    cost = 3
+
+    # rows shorter than this are summed in plain Python,
+    # where NumPy's array-conversion overhead outweighs the vectorized loop
+    _vectorization_threshold = 32
 
     def __init__(self, max_sum: float):
         self.max_sum = max_sum
 
-    @default_on_exception
+    def to_match_stage(self) -> dict:
+        # server-side the total of the first row is compared, without the client-side
+        # refinement that flags an intermediate running-sum excess in rows with negatives
+        return {
+            '$expr': {'$gt': [{'$sum': {'$arrayElemAt': ['$body.body', 0]}}, self.max_sum]}
+        }
+
+    def _find_first_excess_index(self, first_row: list) -> Optional[int]:
+        if len(first_row) < self._vectorization_threshold:
+            running_sum = 0
+            for index, number in enumerate(first_row):
+                running_sum += number
+                if running_sum > self.max_sum:
+                    return index
+            return None
+
+        cumulative_sums = numpy.cumsum(numpy.asarray(first_row, dtype=numpy.float64))
+        excesses = cumulative_sums > self.max_sum
+        if not excesses.any():
+            return None
+        return int(numpy.argmax(excesses))
+
     def validate(self, document: Document) -> ValidationResult:
         has_body = bool(document.body) and bool(document.body[0].body)
 
@@ -222,15 +284,13 @@ class FirstRowSumIsGreaterThanPermitted(DocumentValidator):
                 document
             )
 
-        first_row, first_row_sum = document.body[0].body, 0
-        for index, number in enumerate(first_row):
-            first_row_sum += number
-            if first_row_sum > self.max_sum:
-                return self.create_result(
-                    ValidationStatus.INVALID,
-                    document,
-                    override_location=DiscrepancyLocation(f"$.body[0].body[{index}]")
-                )
+        index = self._find_first_excess_index(document.body[0].body)
+        if index is not None:
+            return self.create_result(
+                ValidationStatus.INVALID,
+                document,
+                override_location=DiscrepancyLocation(f"$.body[0].body[{index}]")
+            )
 
         return super().validate(document)
 
@@ -240,40 +300,132 @@ class DiscrepancyFinder:
     def __init__(
             self,
             *validators: DocumentValidator,
+            workers: Optional[int] = None,
     ):
-        self.validators = validators
+        self.validators = tuple(sorted(validators, key=lambda validator: validator.cost))
+        self.workers = workers
 
-    def find_discrepancies(self, documents: Iterable[Document]) -> Iterable[Discrepancy]:
-        for document, validator in itertools.product(documents, self.validators):
-            logger.info(f'{validator}: validating document {document.document_id}')
+    # documents are handed to worker processes in chunks of this size,
+    # so the per-task pickling overhead is amortized over many documents
+    _chunk_size = 32
+
+    def _validate_document(self, document: Document) -> list[Discrepancy]:
+        discrepancies = []
+
+        for validator in self.validators:
+            # deferred formatting: loguru only renders the message if the
+            # level is enabled, so no f-string is built per (doc, validator)
+            logger.debug('{}: validating document {}', validator, document.document_id)
 
             result = validator.validate(document)
 
             if result.status == ValidationStatus.VALID:
-                logger.debug(f'{validator}: document {document.document_id} is valid')
+                logger.debug('{}: document {} is valid', validator, document.document_id)
                 continue
 
             if result.status == ValidationStatus.ERROR:
                 logger.error(
-                    f'{validator}: error validating document {document.document_id}, {result.info["error"]}')
+                    '{}: error validating document {}, {}', validator, document.document_id,
+                    result.info['error'])
                 error = result.info['error']
-                yield Discrepancy(
+                discrepancies.append(Discrepancy(
                     document_id=document.document_id,
                     discrepancy_id=f'{document.document_id}error{error}',
                     discrepancy_type=DiscrepancyTypeDescription('Error'),
                     location=result.info['location'],
                     details=result.info
-                )
+                ))
                 continue
 
             rule_name = result.info['rule']
             location = result.info['location']
-            logger.debug(f'{validator}: found discrepancy for document {document.document_id}')
+            logger.debug('{}: found discrepancy for document {}', validator, document.document_id)
 
-            yield Discrepancy(
+            discrepancies.append(Discrepancy(
                 document_id=document.document_id,
                 discrepancy_id=f'{document.document_id}{rule_name}',
                 discrepancy_type=DiscrepancyTypeDescription(rule_name),
                 location=location,
                 details=result.info
-            )
+            ))
+
+        return discrepancies
+
+    def find_discrepancies(self, documents: Iterable[Document]) -> Iterable[Discrepancy]:
+        # itertools.product would materialize the documents iterable upfront,
+        # defeating streaming; the explicit document-outer loop pulls one
+        # document at a time and runs every validator against it
+        if self.workers is not None and self.workers > 1:
+            # validation is pure CPU work with no shared state, so documents
+            # can be spread over processes; map keeps their original order
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                for discrepancies in executor.map(
+                        self._validate_document, documents, chunksize=self._chunk_size
+                ):
+                    yield from discrepancies
+            return
+
+        for document in documents:
+            yield from self._validate_document(document)
+
+
+class ServerSideDiscrepancyFinder:
+    """
+    Runs the validators as MongoDB aggregation pipelines, one per rule:
+    documents violating a rule are matched by the validator's `to_match_stage`
+    filter, projected into the Discrepancy shape and `$merge`d straight into
+    the discrepancies collection. The checks execute in the server, so no
+    document is ever shipped to the client.
+
+    Known divergences from the client-side DiscrepancyFinder path:
+
+    * the title rule also flags short-but-present titles, which the
+      client-side `validate` lets through;
+    * the date rule also flags present dates past `max_date`, which the
+      client-side `validate` likewise lets through;
+    * documents without a first row are flagged client-side but never
+      matched by the first-row-sum rule, whose `$sum` of a missing
+      element is 0;
+    * `details.status` is always 'invalid', where the client reports
+      'not_found' for missing titles, dates and bodies (and the
+      intermediate running-sum refinement noted on the sum rule).
+    """
+
+    def __init__(self, *validators: DocumentValidator, into: str = 'discrepancies'):
+        self.validators = validators
+        self.into = into
+
+    def _build_pipeline(self, validator: DocumentValidator) -> list:
+        location = str(validator.location)
+        details = {
+            'document_id': '$document_id',
+            'rule': {'$literal': validator.name},
+            'rule_parameters': {'$literal': validator._static_info['rule_parameters']},
+            'location': {'$literal': location},
+            'status': {'$literal': ValidationStatus.INVALID.value},
+        }
+
+        return [
+            {'$match': validator.to_match_stage()},
+            {'$project': {
+                '_id': 0,
+                'document_id': '$document_id',
+                'discrepancy_id': {'$concat': ['$document_id', {'$literal': validator.name}]},
+                'discrepancy_type': {'$literal': validator.name},
+                'location': {'$literal': location},
+                'details': details,
+            }},
+            # merging on discrepancy_id makes reruns idempotent: an already
+            # recorded discrepancy is kept, not duplicated ($merge requires a
+            # unique index on the "on" field, ensured in find_discrepancies)
+            {'$merge': {'into': self.into, 'on': 'discrepancy_id', 'whenMatched': 'keepExisting'}},
+        ]
+
+    def find_discrepancies(self, collection) -> None:
+        collection.database[self.into].create_index('discrepancy_id', unique=True)
+
+        for validator in self.validators:
+            logger.info(f'{validator}: running server-side validation')
+            # $merge makes the aggregation write its output itself, so the
+            # cursor is empty and exhausting it just executes the pipeline
+            collection.aggregate(self._build_pipeline(validator))